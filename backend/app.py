@@ -5,7 +5,7 @@ import logging
 import traceback
 from models import db, Invoice, Product, CompanyConfig
 from services.xml_parser import parse_nfe_xml
-from sqlalchemy import select, func, or_, update
+from sqlalchemy import select, func, or_, update, case, literal_column
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -38,7 +38,7 @@ if IS_VERCEL:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////tmp/fiscal_control.db'
 else:
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///fiscal_control.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///fiscal_control.db')
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
@@ -205,6 +205,92 @@ def get_analysis_data():
         logger.error(f"Analysis error: {e}")
         return jsonify({"error": str(e)}), 500
 
+ROLLUP_METRICS = ('projected_tax', 'st_to_collect', 'difal', 'v_icms', 'v_st')
+
+def _rollup_columns():
+    """Aggregates shared by every rollup dimension"""
+    return (
+        func.coalesce(func.sum(Product.projected_tax), 0.0).label('projected_tax'),
+        func.sum(case((Product.is_st.is_(True), Product.projected_tax), else_=0.0)).label('st_to_collect'),
+        func.sum(case((Product.is_st.is_(False), Product.projected_tax), else_=0.0)).label('difal'),
+        func.coalesce(func.sum(Product.v_icms), 0.0).label('v_icms'),
+        func.coalesce(func.sum(Product.icms_st_value), 0.0).label('v_st'),
+        func.count(Product.id).label('items_count'),
+    )
+
+def _rollup_totals(sub):
+    """Re-aggregates a pre-grouped subquery built with _rollup_columns"""
+    return tuple(func.sum(sub.c[name]).label(name) for name in ROLLUP_METRICS + ('items_count',))
+
+def _rollup_row(row, **keys):
+    return {
+        **keys,
+        'projected_tax': row.projected_tax,
+        'st_to_collect': row.st_to_collect,
+        'difal': row.difal,
+        'v_icms': row.v_icms,
+        'v_st': row.v_st,
+        'items_count': row.items_count,
+    }
+
+@app.route('/api/analysis/rollup', methods=['GET'])
+def get_analysis_rollup():
+    try:
+        limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+        ncm_digits = min(max(request.args.get('ncm_digits', 2, type=int), 2), 8)
+        order_key = request.args.get('order_by', 'projected_tax')
+        if order_key not in ROLLUP_METRICS:
+            return jsonify({"error": f"order_by must be one of {', '.join(ROLLUP_METRICS)}"}), 400
+
+        def top(stmt, *keys):
+            # Group keys break ties so rows at 0 come back in a stable order
+            return db.session.execute(
+                stmt.order_by(literal_column(order_key).desc(), *keys).limit(limit)
+            ).all()
+
+        # Grouping in ix_invoice_sender order avoids a sort over every product row
+        suppliers = top(
+            select(Invoice.sender_uf, Invoice.sender_cnpj, func.max(Invoice.sender_name).label('sender_name'), *_rollup_columns())
+            .join(Product, Product.invoice_id == Invoice.id)
+            .group_by(Invoice.sender_uf, Invoice.sender_cnpj),
+            Invoice.sender_cnpj, Invoice.sender_uf
+        )
+
+        ufs = top(
+            select(Invoice.sender_uf, *_rollup_columns())
+            .join(Product, Product.invoice_id == Invoice.id)
+            .group_by(Invoice.sender_uf),
+            Invoice.sender_uf
+        )
+
+        # Group by full NCM in index order first, then fold the few distinct
+        # codes into prefixes; empty and NULL share one bucket
+        by_ncm = (
+            select(Product.ncm_clean, *_rollup_columns())
+            .group_by(Product.ncm_clean)
+            .subquery()
+        )
+        ncm_prefix = func.coalesce(func.nullif(func.substr(by_ncm.c.ncm_clean, 1, ncm_digits), ''), 'N/A').label('ncm_prefix')
+        ncms = top(
+            select(ncm_prefix, *_rollup_totals(by_ncm))
+            .group_by(ncm_prefix),
+            ncm_prefix
+        )
+
+        return jsonify({
+            'order_by': order_key,
+            'limit': limit,
+            'ncm_digits': ncm_digits,
+            'suppliers': [
+                _rollup_row(r, cnpj=r.sender_cnpj, name=r.sender_name, uf=r.sender_uf) for r in suppliers
+            ],
+            'ufs': [_rollup_row(r, uf=r.sender_uf) for r in ufs],
+            'ncm_prefixes': [_rollup_row(r, ncm_prefix=r.ncm_prefix) for r in ncms],
+        })
+    except Exception as e:
+        logger.error(f"Rollup error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/search-cest', methods=['POST'])
 def search_missing_cest():
     try:
@@ -315,7 +401,7 @@ def upload_xml():
                     effective_rate = calculate_simples_rate(rbt12)
 
                     for prod_data in data['products']:
-                        ncm = (prod_data['ncm'] or "").replace(".", "")
+                        ncm = (prod_data['ncm'] or "").replace(".", "").replace("-", "").strip()
                         # NCM ST Classifier (Pharmacy Focus)
                         # Rule 1: If it has CEST, it is ST
                         # Rule 2: If NCM starts with common pharmacy ST prefixes
@@ -326,6 +412,7 @@ def upload_xml():
                             code=prod_data['code'],
                             name=prod_data['name'],
                             ncm=prod_data['ncm'],
+                            ncm_clean=ncm,
                             is_st=is_st,
                             cest=prod_data['cest'],
                             cfop=prod_data['cfop'],
@@ -28,6 +28,11 @@ class Invoice(db.Model):
     
     products = db.relationship('Product', backref='invoice', lazy=True)
 
+    # Supplier/UF rollups group on these columns after joining products
+    __table_args__ = (
+        db.Index('ix_invoice_sender', 'sender_uf', 'sender_cnpj', 'sender_name'),
+    )
+
 class CompanyConfig(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     rbt12 = db.Column(db.Float, default=0.0) # Receita Bruta Total 12 meses
@@ -40,6 +45,7 @@ class Product(db.Model):
     code = db.Column(db.String(50))
     name = db.Column(db.String(255))
     ncm = db.Column(db.String(10))
+    ncm_clean = db.Column(db.String(10)) # NCM without dots/dashes, filled at ingest
     cest = db.Column(db.String(10))
     cfop = db.Column(db.String(5))
     quantity = db.Column(db.Float)
@@ -58,3 +64,9 @@ class Product(db.Model):
     cest_mismatch = db.Column(db.Boolean, default=False)
     projected_tax = db.Column(db.Float, default=0.0)
     tax_alert = db.Column(db.String(255), nullable=True)
+
+    # Covering indexes for /api/analysis/rollup (no table lookups on GROUP BY)
+    __table_args__ = (
+        db.Index('ix_product_invoice_rollup', 'invoice_id', 'is_st', 'projected_tax', 'v_icms', 'icms_st_value'),
+        db.Index('ix_product_ncm_rollup', 'ncm_clean', 'is_st', 'projected_tax', 'v_icms', 'icms_st_value'),
+    )
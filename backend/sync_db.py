@@ -1,4 +1,4 @@
-from app import app, db
+from app import app, db, Invoice, Product
 from sqlalchemy import text, inspect
 
 with app.app_context():
@@ -12,9 +12,27 @@ with app.app_context():
             conn.execute(text("ALTER TABLE product ADD COLUMN is_st BOOLEAN DEFAULT 1"))
             conn.commit()
     
+    # Add ncm_clean if missing and backfill it the same way upload does
+    if 'ncm_clean' not in columns:
+        print("Adding ncm_clean column to product table...")
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE product ADD COLUMN ncm_clean VARCHAR(10)"))
+            conn.execute(text("UPDATE product SET ncm_clean = trim(replace(replace(coalesce(ncm, ''), '.', ''), '-', ''))"))
+            conn.commit()
+    
     # Create company_config if missing
     if 'company_config' not in inspector.get_table_names():
         print("Creating company_config table...")
         db.create_all()
     
+    # Create rollup indexes, rebuilding any whose column order has changed
+    for table in (Invoice.__table__, Product.__table__):
+        existing = {i['name']: i['column_names'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            columns = [c.name for c in index.columns]
+            if index.name in existing and existing[index.name] != columns:
+                print(f"Rebuilding index {index.name}...")
+                index.drop(db.engine)
+            index.create(db.engine, checkfirst=True)
+    
     print("Database sync complete.")
@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+# Run against a throwaway database so the local fiscal_control.db is untouched
+db_path = os.path.join(tempfile.mkdtemp(), 'rollup_check.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+from app import app, db, Invoice, Product
+from sqlalchemy import event
+
+with app.app_context():
+    mg = Invoice(number='1', sender_cnpj='11111111000111', sender_name='Distribuidora MG', sender_uf='MG')
+    go = Invoice(number='2', sender_cnpj='22222222000122', sender_name='Distribuidora GO', sender_uf='GO')
+    sp = Invoice(number='3', sender_cnpj='33333333000133', sender_name='Distribuidora SP', sender_uf='SP')
+    db.session.add_all([mg, go, sp])
+    db.session.commit()
+
+    # ncm_clean is filled the way upload_xml normalizes NCM
+    db.session.add_all([
+        Product(invoice_id=mg.id, ncm='30049099', ncm_clean='30049099', is_st=True, projected_tax=10.0, v_icms=1.0, icms_st_value=0.0),
+        Product(invoice_id=mg.id, ncm='3304.99.10', ncm_clean='33049910', is_st=False, projected_tax=5.0, v_icms=2.0, icms_st_value=0.0),
+        Product(invoice_id=go.id, ncm=' 3004-90-10', ncm_clean='30049010', is_st=False, projected_tax=30.0, v_icms=0.5, icms_st_value=0.0),
+        Product(invoice_id=sp.id, ncm=None, ncm_clean=None, is_st=True, projected_tax=0.0, v_icms=3.0, icms_st_value=4.0),
+        Product(invoice_id=sp.id, ncm='', ncm_clean='', is_st=True, projected_tax=0.0, v_icms=1.0, icms_st_value=2.0),
+    ])
+    db.session.commit()
+
+    # Capture the statements the endpoint actually runs and check their plans
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    assert app.test_client().get('/api/analysis/rollup').status_code == 200
+    event.remove(db.engine, 'before_cursor_execute', capture)
+
+    plans = []
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            plan = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+            plans.append(' | '.join(row[-1] for row in plan))
+    assert len(plans) == 3, plans
+    supplier_plan, uf_plan, ncm_plan = plans
+    for plan in (supplier_plan, uf_plan):
+        assert 'COVERING INDEX ix_invoice_sender' in plan, plan
+        assert 'COVERING INDEX ix_product_invoice_rollup' in plan, plan
+        assert 'TEMP B-TREE FOR GROUP BY' not in plan, plan
+    assert 'COVERING INDEX ix_product_ncm_rollup' in ncm_plan, ncm_plan
+    # Only the outer fold over distinct NCM codes may sort, never the product scan
+    assert 'TEMP B-TREE FOR GROUP BY' not in ncm_plan.split('SCAN anon_1')[0], ncm_plan
+
+client = app.test_client()
+
+res = client.get('/api/analysis/rollup').get_json()
+suppliers = {s['cnpj']: s for s in res['suppliers']}
+assert suppliers['11111111000111']['projected_tax'] == 15.0
+assert suppliers['11111111000111']['st_to_collect'] == 10.0
+assert suppliers['11111111000111']['difal'] == 5.0
+assert suppliers['11111111000111']['items_count'] == 2
+assert res['suppliers'][0]['cnpj'] == '22222222000122'
+
+ufs = {u['uf']: u for u in res['ufs']}
+assert ufs['SP']['v_icms'] == 4.0
+assert ufs['SP']['v_st'] == 6.0
+
+# NULL and empty NCM share one bucket
+ncms = {n['ncm_prefix']: n for n in res['ncm_prefixes']}
+assert len(res['ncm_prefixes']) == 3
+assert ncms['30']['projected_tax'] == 40.0
+assert ncms['33']['projected_tax'] == 5.0
+assert ncms['N/A']['items_count'] == 2
+
+res = client.get('/api/analysis/rollup?ncm_digits=6').get_json()
+ncms = {n['ncm_prefix']: n for n in res['ncm_prefixes']}
+assert ncms['300490']['items_count'] == 2
+assert ncms['330499']['items_count'] == 1
+
+res = client.get('/api/analysis/rollup?order_by=st_to_collect&limit=1').get_json()
+assert [s['cnpj'] for s in res['suppliers']] == ['11111111000111']
+
+res = client.get('/api/analysis/rollup?order_by=difal&limit=1').get_json()
+assert [s['cnpj'] for s in res['suppliers']] == ['22222222000122']
+assert [u['uf'] for u in res['ufs']] == ['GO']
+
+assert client.get('/api/analysis/rollup?order_by=total_value').status_code == 400
+
+print("Rollup checks passed.")